@@ -1,14 +1,18 @@
 import streamlit as st
 import geopandas as gpd
+import shapely
 import requests
 import pandas as pd
+import numpy as np
 import folium
-import io
-import concurrent.futures
+import math
 from streamlit_folium import folium_static
 from datetime import datetime
 from branca.colormap import LinearColormap
 import joblib
+from joblib import Memory
+from requests.adapters import HTTPAdapter
+from scipy.spatial import cKDTree
 from sklearn.preprocessing import StandardScaler
 
 # File paths
@@ -28,71 +32,117 @@ def load_scaler():
 trained_model = load_model()
 scaler = load_scaler()
 
-# Load and preprocess shapefile
+# Load and preprocess shapefile once per process
+@st.cache_resource
+def load_wards():
+    # pyogrio with Arrow transfer hands GDAL's features to pandas in bulk
+    gdf = gpd.read_file(SHAPEFILE_PATH, engine="pyogrio", use_arrow=True).to_crs("EPSG:4326")
+    # Centroids come from the full-resolution polygons; the simplified copy is only for the map.
+    # Both run as single vectorized GEOS calls over the whole geometry array
+    geoms = gdf.geometry.to_numpy()
+    centroids = shapely.centroid(geoms)
+    gdf["lat"] = shapely.get_y(centroids).astype("float32")
+    gdf["lon"] = shapely.get_x(centroids).astype("float32")
+    gdf["geometry_simple"] = gpd.GeoSeries(shapely.simplify(geoms, 0.001, preserve_topology=True), index=gdf.index, crs=gdf.crs)
+    return gdf, tuple(gdf.total_bounds)
+
 st.title("Malaria Case Prediction")
-gdf = gpd.read_file(SHAPEFILE_PATH).to_crs("EPSG:4326")
-gdf["geometry"] = gdf["geometry"].simplify(0.001, preserve_topology=True)
-gdf["lat"] = gdf.geometry.centroid.y
-gdf["lon"] = gdf.geometry.centroid.x
+wards, bounds = load_wards()
+gdf = wards.copy()  # Per-run copy so climate columns never leak into the cached frame
 
 # NASA POWER API Parameters
-BASE_URL = "https://power.larc.nasa.gov/api/temporal/daily/point"
+BASE_URL = "https://power.larc.nasa.gov/api/temporal/daily/regional"
 PARAMETERS = "T2M,RH2M,PRECTOTCORR"
 COMMUNITY = "RE"
+CLIMATE_LABELS = {"T2M": "Temperature (°C):", "RH2M": "Humidity (%):", "PRECTOTCORR": "Precipitation (mm/day):"}
+MAX_REGION_DEG = 10  # Largest bounding box side the regional endpoint accepts
+GRID_STEP_DEG = 0.625  # NASA POWER grid spacing (0.5° lat x 0.625° lon); farther cells belong to another tile
+
+# Shared HTTP session (one per process, not per rerun) so region requests reuse a warm connection
+@st.cache_resource
+def get_session():
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32))
+    return session
 
 date = st.sidebar.date_input("Select Date", datetime(2024, 1, 1))
 
+# Fetch one bounding box from NASA POWER (failures raise so they are never cached)
+def _fetch_region(lat_min, lat_max, lon_min, lon_max, date_str):
+    url = (
+        f"{BASE_URL}?parameters={PARAMETERS}"
+        f"&latitude-min={lat_min}&latitude-max={lat_max}&longitude-min={lon_min}&longitude-max={lon_max}"
+        f"&start={date_str}&end={date_str}&community={COMMUNITY}&format=JSON"
+    )
+    response = get_session().get(url, timeout=30)
+    response.raise_for_status()
+    rows = []
+    for feature in response.json()["features"]:
+        lon, lat = feature["geometry"]["coordinates"][:2]
+        values = feature["properties"]["parameter"]
+        rows.append({"Latitude": lat, "Longitude": lon, **{p: values[p][date_str] for p in PARAMETERS.split(",")}})
+    return pd.DataFrame(rows)
+
+# On-disk cache of NASA POWER responses, shared across sessions and restarts (built once per process)
+@st.cache_resource
+def get_region_fetcher():
+    return Memory("./.nasa_cache", verbose=0).cache(_fetch_region)
+
+def _split_range(lo, hi):
+    """Split [lo, hi] into equal spans no wider than MAX_REGION_DEG"""
+    n = max(1, math.ceil((hi - lo) / MAX_REGION_DEG))
+    step = (hi - lo) / n
+    return [(round(lo + i * step, 3), round(lo + (i + 1) * step, 3)) for i in range(n)]
+
 # Function to fetch NASA POWER climate data
 @st.cache_data(show_spinner="Fetching Climate Data...")
-def fetch_nasa_data(locations, date):
+def fetch_nasa_data(bounds, date):
     date_str = date.strftime("%Y%m%d")
+    lon_min, lat_min, lon_max, lat_max = bounds
     results = []
     
-    def fetch(lat, lon):
-        url = f"{BASE_URL}?parameters={PARAMETERS}&latitude={lat}&longitude={lon}&start={date_str}&end={date_str}&community={COMMUNITY}&format=CSV"
-        response = requests.get(url)
-        if response.status_code == 200:
-            lines = response.text.splitlines()
-            header_end = next(i for i, line in enumerate(lines) if "-END HEADER-" in line)
-            df = pd.read_csv(io.StringIO("\n".join(lines[header_end + 1:])))
-            df[["Latitude", "Longitude"]] = lat, lon
-            return df
-        return None
-    
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = [executor.submit(fetch, lat, lon) for lat, lon in locations]
-        for future in concurrent.futures.as_completed(futures):
-            result = future.result()
-            if result is not None:
-                results.append(result)
+    for lat_lo, lat_hi in _split_range(lat_min, lat_max):
+        for lon_lo, lon_hi in _split_range(lon_min, lon_max):
+            try:
+                results.append(get_region_fetcher()(lat_lo, lat_hi, lon_lo, lon_hi, date_str))
+            except Exception as e:
+                st.warning(f"⚠️ Climate tile {lat_lo}–{lat_hi}°N, {lon_lo}–{lon_hi}°E failed: {e}")
+                continue
     
     return pd.concat(results, ignore_index=True) if results else None
 
-# Fetch climate data
-locations = list(gdf[["lat", "lon"]].drop_duplicates().itertuples(index=False, name=None))
-df = fetch_nasa_data(locations, date)
+# Fetch climate data for the whole shapefile extent in one regional grid
+df = fetch_nasa_data(bounds, date)
 
 if df is not None:
-    gdf = gdf.merge(df, left_on=["lat", "lon"], right_on=["Latitude", "Longitude"], how="left")
-    gdf.rename(columns={"PRECTOTCORR": "Rainfall", "T2M": "LST", "RH2M": "Relative_H"}, inplace=True)
+    # Adjacent tiles share their edge cells, so collapse repeated grid points first
+    grid = df.groupby(["Latitude", "Longitude"], as_index=False).mean()
+
+    # Assign every ward centroid to its nearest grid cell
+    tree = cKDTree(grid[["Latitude", "Longitude"]].to_numpy())
+    dist, idx = tree.query(gdf[["lat", "lon"]].to_numpy(), k=1)
+
+    # NASA values get their own columns and are only shown in the tooltip; the model keeps the
+    # shapefile's Rainfall/LST/Relative_H, which are in the units the random forest was trained on
+    for col in CLIMATE_LABELS:
+        gdf[col] = grid[col].to_numpy()[idx]
+    
+    # A ward more than one grid step from every cell lies in a tile that failed; leave it blank
+    # rather than showing a neighbouring tile's values
+    far = dist > GRID_STEP_DEG
+    if far.any():
+        gdf.loc[far, list(CLIMATE_LABELS)] = np.nan
+        st.warning(f"⚠️ No climate data for {int(far.sum())} wards outside the downloaded tiles.")
     
     # Feature selection and scaling
     features = ["Rainfall", "LST", "Relative_H"]
     if all(f in gdf.columns for f in features):
-        X_pred = gdf[features].fillna(gdf[features].mean())
+        # Raw array in training column order, missing values filled with the column mean
+        X_pred = gdf[list(scaler.feature_names_in_)].to_numpy(dtype=np.float64)
+        X_pred = np.where(np.isnan(X_pred), np.nanmean(X_pred, axis=0), X_pred)
 
-        # Drop duplicate columns if they exist
-        X_pred = X_pred.loc[:, ~X_pred.columns.duplicated()]
-
-        # Ensure column order matches training
-        X_pred = X_pred.reindex(columns=scaler.feature_names_in_, fill_value=0)
-
-        # Debugging info (commented out)
-        # print("Features used in training:", scaler.feature_names_in_)
-        # print("Features in X_pred before scaling:", X_pred.columns.tolist())
-
-        # Transform and predict
-        X_pred_scaled = scaler.transform(X_pred)
+        # Standardize with the fitted statistics directly (no DataFrame round-trip) and predict
+        X_pred_scaled = (X_pred - scaler.mean_) / scaler.scale_
         gdf["pred_cases"] = trained_model.predict(X_pred_scaled).astype(int)
     else:
         st.error("❌ Missing required climate features for prediction.")
@@ -100,19 +150,23 @@ if df is not None:
     
     # Folium Map
     m = folium.Map(location=[gdf["lat"].mean(), gdf["lon"].mean()], zoom_start=6)
-    colormap = LinearColormap(["blue", "cyan", "yellow", "orange", "red"], vmin=gdf["pred_cases"].min(), vmax=gdf["pred_cases"].max())
+    vmin, vmax = gdf["pred_cases"].min(), gdf["pred_cases"].max()
+    colormap = LinearColormap(["blue", "cyan", "yellow", "orange", "red"], vmin=vmin, vmax=vmax)
+    
+    # Resolve fill colors through a 256-entry lookup table instead of one colormap call per ward
+    lut = np.array([colormap(v) for v in np.linspace(vmin, vmax, 256)])
+    lut_idx = ((gdf["pred_cases"].to_numpy() - vmin) / ((vmax - vmin) or 1) * 255).clip(0, 255).astype(np.uint8)
+    gdf["fill_color"] = lut[lut_idx]
     
-    for _, row in gdf.iterrows():
-        if "wardname" in gdf.columns and "lganame" in gdf.columns:
-            tooltip_text = f"Predicted Cases: {row['pred_cases']}\nWard: {row['wardname']}\nLGA: {row['lganame']}"
-        else:
-            tooltip_text = f"Predicted Cases: {row['pred_cases']}"
-        
-        folium.GeoJson(
-            row["geometry"],
-            style_function=lambda x, val=row["pred_cases"]: {"fillColor": colormap(val), "color": "black", "weight": 1, "fillOpacity": 0.7},
-            tooltip=tooltip_text
-        ).add_to(m)
+    # Render all wards as a single GeoJSON layer
+    tooltip_aliases = {"pred_cases": "Predicted Cases:", "wardname": "Ward:", "lganame": "LGA:", **CLIMATE_LABELS}
+    tooltip_fields = [c for c in tooltip_aliases if c in gdf.columns]
+    gdf_out = gpd.GeoDataFrame(gdf[tooltip_fields + ["fill_color"]], geometry=gdf["geometry_simple"])
+    folium.GeoJson(
+        gdf_out,
+        style_function=lambda f: {"fillColor": f["properties"]["fill_color"], "color": "black", "weight": 1, "fillOpacity": 0.7},
+        tooltip=folium.GeoJsonTooltip(fields=tooltip_fields, aliases=[tooltip_aliases[c] for c in tooltip_fields]),
+    ).add_to(m)
     
     colormap.caption = "Predicted Malaria Cases"
     colormap.add_to(m)
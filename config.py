@@ -4,6 +4,8 @@ Centralizes all configuration parameters
 """
 
 import os
+import re
+from functools import lru_cache
 from typing import List, Dict
 
 # ============================================================
@@ -23,6 +25,7 @@ class Config:
     MODEL_PATH_ALT = 'models/ppo_malaria2'
     SCALER_PATH = 'models/scaler.pkl'
     SCALER_PATH_ALT = 'models/scaler2.pkl'
+    ACTION_TABLE_PATH = 'models/ppo_malaria_actions.npz'  # PPO action for each of the 2^10 symptom combinations
     DATA_PATH = 'test_records.csv'
     BACKUP_DIR = 'backups'
     LOGO_PATH = "images/eHA-logo-blue_320x132.png"
@@ -95,27 +98,42 @@ class Config:
     @classmethod
     def validate_patient_id(cls, patient_id: str) -> tuple[bool, str]:
         """
-        Validate patient ID format
+        Validate patient ID format (delegates to the cached module-level validator)
         Returns: (is_valid, error_message)
         """
-        import re
-        
-        if not patient_id:
-            return False, "Patient ID cannot be empty"
-        
-        if len(patient_id) < cls.PATIENT_ID_MIN_LENGTH:
-            return False, f"Patient ID must be at least {cls.PATIENT_ID_MIN_LENGTH} characters"
-        
-        if len(patient_id) > cls.PATIENT_ID_MAX_LENGTH:
-            return False, f"Patient ID cannot exceed {cls.PATIENT_ID_MAX_LENGTH} characters"
-        
-        if not re.match(cls.PATIENT_ID_PATTERN, patient_id):
-            return False, "Patient ID can only contain letters, numbers, underscores, and hyphens"
-        
-        return True, ""
+        return validate_patient_id(patient_id)
     
     @classmethod
     def create_directories(cls):
         """Create necessary directories if they don't exist"""
         os.makedirs(cls.BACKUP_DIR, exist_ok=True)
         os.makedirs(os.path.dirname(cls.MODEL_PATH), exist_ok=True)
+
+
+# ============================================================
+# VALIDATION
+# ============================================================
+
+# Compiled once at import instead of on every validation
+_PATIENT_ID_RE = re.compile(Config.PATIENT_ID_PATTERN)
+
+
+@lru_cache(maxsize=1024)
+def validate_patient_id(patient_id: str) -> tuple[bool, str]:
+    """
+    Validate patient ID format (memoized, IDs are re-validated on every rerun)
+    Returns: (is_valid, error_message)
+    """
+    if not patient_id:
+        return False, "Patient ID cannot be empty"
+    
+    if len(patient_id) < Config.PATIENT_ID_MIN_LENGTH:
+        return False, f"Patient ID must be at least {Config.PATIENT_ID_MIN_LENGTH} characters"
+    
+    if len(patient_id) > Config.PATIENT_ID_MAX_LENGTH:
+        return False, f"Patient ID cannot exceed {Config.PATIENT_ID_MAX_LENGTH} characters"
+    
+    if not _PATIENT_ID_RE.match(patient_id):
+        return False, "Patient ID can only contain letters, numbers, underscores, and hyphens"
+    
+    return True, ""
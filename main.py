@@ -1,12 +1,5 @@
 import streamlit as st
 import os
-import subprocess
-import threading
-import sys  # Import sys module to fix the error
-
-# Function to run a Streamlit app in a new thread
-def run_streamlit_app(script_name):
-    subprocess.run([sys.executable, "-m", "streamlit", "run", script_name])
 
 # Function to show the main landing page
 def main_landing_page():
@@ -22,14 +15,12 @@ def main_landing_page():
     Choose an option below to explore predictions for clinical or non-clinical malaria cases.
     """)
 
-    # Buttons to navigate to the specific prediction apps
+    # Buttons to navigate to the specific prediction pages in this process
     if st.button("Clinical Malaria Prediction"):
-        st.write("Navigating to Clinical Malaria Prediction...")
-        threading.Thread(target=run_streamlit_app, args=("malaria_reinforcement.py",)).start()
+        st.switch_page("pages/malaria_reinforcement.py")
         
     if st.button("Non-Clinical Malaria Prediction"):
-        st.write("Navigating to Non-Clinical Malaria Prediction...")
-        threading.Thread(target=run_streamlit_app, args=("non_clinical_malaria_streamlit.py",)).start()
+        st.switch_page("pages/non_clinical_malaria_streamlit.py")
 
     # Features Section
     st.subheader("Prediction Features")
@@ -0,0 +1,87 @@
+"""
+Gymnasium environment used for online PPO retraining of the clinical model
+Kept in its own module so gymnasium/stable_baselines3 are only imported when retraining runs
+"""
+
+import numpy as np
+import gymnasium as gym  # Updated to Gymnasium
+from gymnasium import spaces
+from stable_baselines3.common.vec_env import VecEnv
+
+
+# Custom Gymnasium Environment for Malaria Prediction
+class MalariaEnv(gym.Env):
+    def __init__(self):
+        super(MalariaEnv, self).__init__()
+        self.observation_space = spaces.Box(low=-1, high=1, shape=(10,), dtype=np.float32)  # Match trained model
+        self.action_space = spaces.Discrete(2)  # Binary classification (0=Negative, 1=Positive)
+        self.state = np.zeros(10, dtype=np.float32)
+        self.done = False
+
+    def reset(self, seed=None, options=None):
+        self.state = np.random.uniform(-1, 1, size=(10,)).astype(np.float32)  # Match trained model
+        self.done = False
+        return self.state, {}  # Gymnasium requires returning (obs, info)
+
+    def step(self, action):
+        reward = 1 if (action == 1 and np.sum(self.state) > 5) else -1  # Reward logic
+        self.done = True
+        return self.state, reward, self.done, False, {}  # Gymnasium requires (obs, reward, done, truncated, info)
+
+    def render(self, mode='human'):
+        pass
+
+    def close(self):
+        pass
+
+
+def batch_rewards(actions, states):
+    """MalariaEnv.step's reward for a batch: +1 where action 1 meets a state sum above 5, else -1"""
+    positive = states.sum(axis=1) > 5
+    positive &= actions == 1
+    return positive.astype(np.float32) * 2 - 1
+
+
+class MalariaVecEnv(VecEnv):
+    """
+    Batched MalariaEnv: num_envs copies stepped with single NumPy calls
+    Every episode is one step long, so each step returns terminal observations and auto-resets
+    """
+
+    def __init__(self, num_envs=16):
+        env = MalariaEnv()
+        super().__init__(num_envs, env.observation_space, env.action_space)
+        self.states = np.zeros((num_envs, 10), dtype=np.float32)
+        self.actions = np.zeros(num_envs, dtype=np.int64)
+        self.dones = np.ones(num_envs, dtype=bool)  # Every step ends its episode
+
+    def _sample_states(self):
+        return np.random.uniform(-1, 1, size=(self.num_envs, 10)).astype(np.float32)  # Match trained model
+
+    def reset(self):
+        self.states = self._sample_states()
+        return self.states.copy()
+
+    def step_async(self, actions):
+        self.actions = np.asarray(actions).reshape(self.num_envs)
+
+    def step_wait(self):
+        rewards = batch_rewards(self.actions, self.states)
+        infos = [{'terminal_observation': obs, 'TimeLimit.truncated': False} for obs in self.states]
+        self.states = self._sample_states()
+        return self.states.copy(), rewards, self.dones, infos
+
+    def close(self):
+        pass
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name)] * len(self._get_indices(indices))
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return [None] * len(self._get_indices(indices))
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False] * len(self._get_indices(indices))
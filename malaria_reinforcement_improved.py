@@ -13,6 +13,8 @@ import pandas as pd
 import joblib
 import os
 import gc
+import hashlib
+import importlib.util
 from datetime import datetime
 from typing import Optional
 
@@ -26,20 +28,9 @@ from utils import (
     format_datetime
 )
 
-# Lazy imports for optional dependencies
-try:
-    from stable_baselines3 import PPO
-    from stable_baselines3.common.vec_env import DummyVecEnv
-    import gymnasium as gym
-    from gymnasium import spaces
-    PPO_AVAILABLE = True
-except ImportError:
-    PPO_AVAILABLE = False
-
-try:
-    import torch
-except ImportError:
-    torch = None
+# Lazy imports for optional dependencies: torch/stable_baselines3 are only imported when the
+# action table has to be rebuilt from the PPO model (see load_action_table)
+PPO_AVAILABLE = importlib.util.find_spec('stable_baselines3') is not None
 
 # ============================================================
 # PAGE CONFIGURATION
@@ -56,7 +47,6 @@ st.set_page_config(
 # MODEL LOADING WITH ERROR HANDLING
 # ============================================================
 
-@st.cache_resource(show_spinner="Loading AI model...")
 def load_model_and_scaler():
     """
     Load the trained PPO model and scaler with error handling
@@ -74,8 +64,14 @@ def load_model_and_scaler():
         if not os.path.exists(Config.SCALER_PATH):
             return None, None, f"Scaler file not found: {Config.SCALER_PATH}"
         
+        import torch
+        from stable_baselines3 import PPO
+        
+        # Inference here is small CPU work: one intra-op thread avoids oversubscribing 1-vCPU containers
+        torch.set_num_threads(1)
+        
         # Load model and scaler
-        model = PPO.load(Config.MODEL_PATH)
+        model = PPO.load(Config.MODEL_PATH, device='cpu')
         scaler = joblib.load(Config.SCALER_PATH)
         
         return model, scaler, None
@@ -84,8 +80,61 @@ def load_model_and_scaler():
         return None, None, f"Error loading model: {str(e)}"
 
 
+def build_action_table(model, scaler) -> np.ndarray:
+    """
+    Evaluate the deterministic PPO policy on every symptom combination in one batched call
+    Returns: int8 array indexed by SymptomProcessor.pack_feature_vector codes
+    """
+    import torch
+    
+    # Fitted StandardScaler statistics as float32, so predictions skip sklearn's DataFrame checks
+    mean, inv_scale = scaler.mean_.astype(np.float32), (1.0 / scaler.scale_).astype(np.float32)
+    
+    all_vectors = SymptomProcessor.unpack_feature_codes(np.arange(2 ** len(Config.FEATURES)))
+    scaled_values = SymptomProcessor.scale_feature_vector(all_vectors, mean, inv_scale)
+    with torch.inference_mode():
+        actions, _ = model.predict(scaled_values, deterministic=True)
+    return actions.astype(np.int8)
+
+
+@st.cache_resource(show_spinner="Loading AI model...")
+def load_action_table():
+    """
+    Load the saved action table, rebuilding it when it was built from a different model zip or scaler
+    Returns: (action_table, error_message)
+    """
+    source_files = [f"{Config.MODEL_PATH}.zip", Config.SCALER_PATH]
+    for path in source_files:
+        if not os.path.exists(path):
+            return None, f"Model file not found: {path}"
+    
+    # Git does not keep mtimes, so the table records a SHA-256 over the zip and the scaler it was
+    # built from (the scaler's mean and scale are baked into every entry)
+    source_hash = hashlib.sha256()
+    for path in source_files:
+        with open(path, 'rb') as f:
+            source_hash.update(f.read())
+    source_digest = source_hash.hexdigest()
+    if os.path.exists(Config.ACTION_TABLE_PATH):
+        with np.load(Config.ACTION_TABLE_PATH) as saved:
+            if 'source' in saved.files and str(saved['source']) == source_digest:
+                return saved['actions'], None
+    
+    model, scaler, model_error = load_model_and_scaler()
+    if model_error:
+        return None, model_error
+    
+    action_table = build_action_table(model, scaler)
+    try:
+        np.savez(Config.ACTION_TABLE_PATH, actions=action_table, source=np.array(source_digest))
+    except OSError:
+        pass  # Read-only deployments rebuild the table once per process
+    
+    return action_table, None
+
+
 # Load model
-model, scaler, model_error = load_model_and_scaler()
+action_table, model_error = load_action_table()
 
 # ============================================================
 # HEADER AND STATUS
@@ -182,46 +231,43 @@ if page == "🩺 Symptom Assessment":
     
     st.markdown("---")
     
-    # Symptom Selection Section
-    st.subheader("2️⃣ Symptom Checklist")
-    st.markdown("*Select all symptoms that the patient is experiencing:*")
-    
-    selected_features = {}
-    symptom_count = 0
-    
-    # Display symptoms in a 2-column layout
-    col1, col2 = st.columns(2)
-    
-    for idx, feature in enumerate(Config.FEATURES):
-        display_name = Config.FEATURE_DISPLAY_NAMES.get(feature, feature.replace('_', ' ').title())
-        
-        # Alternate between columns
-        with col1 if idx % 2 == 0 else col2:
-            response = st.checkbox(
-                display_name,
-                key=f"symptom_{feature}"
+    # Symptom checklist and predict button share a form, so ticking boxes does not rerun the page
+    with st.form("symptom_form"):
+        # Symptom Selection Section
+        st.subheader("2️⃣ Symptom Checklist")
+        st.markdown("*Select all symptoms that the patient is experiencing:*")
+        
+        selected_features = {}
+        
+        # Display symptoms in a 2-column layout
+        col1, col2 = st.columns(2)
+        
+        for idx, feature in enumerate(Config.FEATURES):
+            display_name = Config.FEATURE_DISPLAY_NAMES.get(feature, feature.replace('_', ' ').title())
+            
+            # Alternate between columns
+            with col1 if idx % 2 == 0 else col2:
+                response = st.checkbox(
+                    display_name,
+                    key=f"symptom_{feature}"
+                )
+                selected_features[feature] = 1 if response else 0
+        
+        st.markdown("---")
+        
+        # Prediction Section
+        st.subheader("3️⃣ Get Prediction")
+        
+        col1, col2, col3 = st.columns([1, 1, 1])
+        
+        with col2:
+            predict_button = st.form_submit_button(
+                "🔍 Predict Malaria Risk",
+                type="primary",
+                use_container_width=True
             )
-            selected_features[feature] = 1 if response else 0
-            if response:
-                symptom_count += 1
     
-    # Display symptom count
-    st.info(f"✓ {symptom_count} symptom(s) selected")
-    
-    st.markdown("---")
-    
-    # Prediction Section
-    st.subheader("3️⃣ Get Prediction")
-    
-    col1, col2, col3 = st.columns([1, 1, 1])
-    
-    with col2:
-        predict_button = st.button(
-            "🔍 Predict Malaria Risk",
-            type="primary",
-            use_container_width=True,
-            disabled=(symptom_count == 0 or not patient_id_input)
-        )
+    symptom_count = sum(selected_features.values())
     
     # Handle prediction
     if predict_button:
@@ -233,18 +279,17 @@ if page == "🩺 Symptom Assessment":
         if not is_valid:
             st.error(f"❌ {error_msg}")
         else:
+            # Display symptom count
+            st.info(f"✓ {symptom_count} symptom(s) selected")
+            
             try:
                 with UIHelper.show_progress_indicator("🤖 Analyzing symptoms..."):
                     # Create feature vector
                     feature_values = SymptomProcessor.create_feature_vector(selected_features)
                     
-                    # Scale features
-                    feature_df = pd.DataFrame(feature_values, columns=Config.FEATURES)
-                    scaled_values = scaler.transform(feature_df)
-                    
-                    # Get prediction
-                    action, _ = model.predict(scaled_values, deterministic=True)
-                    predicted_case = Config.POSITIVE_LABEL if action[0] == 1 else Config.NEGATIVE_LABEL
+                    # Get prediction (precomputed for every symptom combination)
+                    action = action_table[SymptomProcessor.pack_feature_vector(feature_values)]
+                    predicted_case = Config.POSITIVE_LABEL if action == 1 else Config.NEGATIVE_LABEL
                     
                     # Store in session state
                     st.session_state['patient_id'] = patient_id
@@ -411,21 +456,16 @@ elif page == "📊 Test Results & Data":
             with col2:
                 end_date = st.date_input("End Date")
             
-            # Filter by date range
+            # Filter by date range (dates are parsed once per data file version)
             try:
-                filtered_df['Date_parsed'] = pd.to_datetime(filtered_df['Date'], errors='coerce')
-                filtered_df = filtered_df[
-                    (filtered_df['Date_parsed'].dt.date >= start_date) &
-                    (filtered_df['Date_parsed'].dt.date <= end_date)
-                ]
-                filtered_df = filtered_df.drop('Date_parsed', axis=1)
+                filtered_df = DataManager.filter_by_date_range(df, start_date, end_date)
             except:
                 st.warning("Error filtering by date")
                 
         elif filter_option == "👤 Patient ID":
             patient_filter = st.text_input("Enter Patient ID:")
             if patient_filter:
-                filtered_df = df[df['Patient ID'].str.contains(patient_filter, case=False, na=False)]
+                filtered_df = DataManager.filter_by_patient_id(df, patient_filter)
         
         # Display filtered data
         if not filtered_df.empty:
@@ -441,38 +481,28 @@ elif page == "📊 Test Results & Data":
             st.markdown("---")
             st.subheader("💾 Download Options")
             
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                csv_data = filtered_df.to_csv(index=False).encode(Config.CSV_ENCODING)
-                st.download_button(
-                    label="📥 Download CSV",
-                    data=csv_data,
-                    file_name=f"malaria_trial_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                    mime="text/csv",
-                    use_container_width=True
-                )
-            
-            with col2:
-                tsv_data = filtered_df.to_csv(index=False, sep='\\t').encode(Config.CSV_ENCODING)
-                st.download_button(
-                    label="📊 Download TSV (Excel)",
-                    data=tsv_data,
-                    file_name=f"malaria_trial_{datetime.now().strftime('%Y%m%d_%H%M%S')}.tsv",
-                    mime="text/tab-separated-values",
-                    use_container_width=True
-                )
+            # Only the chosen format is encoded on each rerun (not all three)
+            export_format = st.radio(
+                "Format:",
+                ["📥 CSV", "📊 TSV (Excel)", "📄 JSON"],
+                horizontal=True
+            )
             
-            with col3:
+            if export_format == "📥 CSV":
+                data, extension, mime = DataManager.export_delimited(filtered_df, ','), "csv", "text/csv"
+            elif export_format == "📊 TSV (Excel)":
+                data, extension, mime = DataManager.export_delimited(filtered_df, '\t'), "tsv", "text/tab-separated-values"
+            else:
                 # JSON export for API integration
-                json_data = filtered_df.to_json(orient='records', date_format='iso')
-                st.download_button(
-                    label="📄 Download JSON",
-                    data=json_data,
-                    file_name=f"malaria_trial_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
-                    mime="application/json",
-                    use_container_width=True
-                )
+                data, extension, mime = filtered_df.to_json(orient='records', date_format='iso'), "json", "application/json"
+            
+            st.download_button(
+                label=f"{export_format.split(' ', 1)[0]} Download {extension.upper()}",
+                data=data,
+                file_name=f"malaria_trial_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}",
+                mime=mime,
+                use_container_width=True
+            )
         else:
             st.warning("No records match the selected filter.")
 
@@ -1,22 +1,36 @@
 import streamlit as st
 import geopandas as gpd
+import shapely
 import requests
 import pandas as pd
+import numpy as np
 import folium
-import io
-import concurrent.futures
+import math
+import os
+import time
+import threading
+import hashlib
+from pathlib import Path
 from streamlit_folium import folium_static
 from datetime import datetime
 from branca.colormap import LinearColormap
 import joblib
+from scipy.spatial import cKDTree
 from sklearn.preprocessing import StandardScaler
 
+# Optional fast JSON parser for the large NASA POWER responses
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 st.title("Non-Clinical Malaria Prediction")
 
 # File paths
 SHAPEFILE_PATH = "./ward/Wards.shp"
 MODEL_PATH = "./Models/Non Clinical/models/random_forest.joblib"
 SCALER_PATH = "./Models/Non Clinical/models/scaler_rf.joblib"
+WARDS_CACHE_PATH = Path("cache/wards.feather")
 
 # Cached model and scaler loading
 @st.cache_resource
@@ -30,95 +44,214 @@ def load_scaler():
 trained_model = load_model()
 scaler = load_scaler()
 
-# Load and preprocess shapefile
+# Load and preprocess shapefile once per process; the result is also kept as Feather
+# so cold starts skip shapefile parsing, reprojection and simplification
+@st.cache_resource
+def load_wards():
+    if WARDS_CACHE_PATH.exists() and WARDS_CACHE_PATH.stat().st_mtime >= os.path.getmtime(SHAPEFILE_PATH):
+        return gpd.read_feather(WARDS_CACHE_PATH)
+    gdf = gpd.read_file(SHAPEFILE_PATH).to_crs("EPSG:4326")
+    # Simplify and take centroids as single vectorized GEOS calls over the whole geometry array
+    geoms = shapely.simplify(gdf.geometry.to_numpy(), 0.001, preserve_topology=True)
+    gdf["geometry"] = gpd.GeoSeries(geoms, index=gdf.index, crs=gdf.crs)
+    centroids = shapely.centroid(geoms)
+    gdf["lat"] = shapely.get_y(centroids)
+    gdf["lon"] = shapely.get_x(centroids)
+    WARDS_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    gdf.to_feather(WARDS_CACHE_PATH)
+    return gdf
+
 st.title("🦟 Malaria Case Prediction & 🌍 Climate Data ")
-gdf = gpd.read_file(SHAPEFILE_PATH).to_crs("EPSG:4326")
-gdf["geometry"] = gdf["geometry"].simplify(0.001, preserve_topology=True)
-gdf["lat"] = gdf.geometry.centroid.y
-gdf["lon"] = gdf.geometry.centroid.x
+gdf = load_wards().copy()  # Per-run copy so climate columns never leak into the cached frame
 
 # NASA POWER API Parameters
-BASE_URL = "https://power.larc.nasa.gov/api/temporal/daily/point"
+BASE_URL = "https://power.larc.nasa.gov/api/temporal/daily/regional"
 PARAMETERS = "T2M,RH2M,PRECTOTCORR"
 COMMUNITY = "RE"
+CLIMATE_LAYERS = {"Temperature": "T2M", "Humidity": "RH2M", "Precipitation": "PRECTOTCORR"}
+MAX_REGION_DEG = 10  # Largest bounding box side the regional endpoint accepts
+GRID_STEP_DEG = 0.625  # NASA POWER grid spacing (0.5° lat x 0.625° lon); farther cells belong to another tile
+MISSING_FILL = "#808080"  # Map color for wards without climate data
+
+# Map palette (blue, cyan, yellow, orange, red) as evenly spaced RGB stops, matching LinearColormap
+COLOR_STOPS = np.linspace(0, 1, 5)
+COLOR_RGB = np.array([[0, 0, 255], [0, 255, 255], [255, 255, 0], [255, 165, 0], [255, 0, 0]])
+HEX_BYTES = np.array([f"{i:02x}" for i in range(256)])
+
+# One HTTP session per process, so requests across reruns and sessions reuse a warm TLS connection
+@st.cache_resource
+def get_session():
+    return requests.Session()
+
+# NASA POWER request budget (requests per minute, 0 = unlimited); root-level secrets are exported as env vars
+NASA_POWER_RPM = float(os.getenv('NASA_POWER_RPM', '60'))
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rpm` requests per minute with bursts up to `burst` (rpm <= 0: no limit)"""
+    def __init__(self, rpm, burst=None):
+        self.rate = rpm / 60.0
+        self.capacity = burst or max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+# One bucket per process so every browser session shares the same NASA POWER budget
+@st.cache_resource
+def get_rate_limiter():
+    return TokenBucket(NASA_POWER_RPM)
+
+# Persistent climate cache: "enabled" reads and writes, "replay" only reads (never calls the API,
+# for reproducible CI runs), "disabled" always calls the API
+NASA_CACHE_DIR = Path("cache/nasa")
+NASA_CACHE_POLICY = os.getenv('NASA_CACHE_POLICY', 'enabled').lower()
 
 date = st.sidebar.date_input("Select Date", datetime(2024, 1, 1))
 selected_layer = st.sidebar.radio("Select Layer", ["Predicted Malaria Cases","Temperature", "Humidity", "Precipitation"])
 
+# Fetch one bounding box of the NASA POWER grid as rows of (Latitude, Longitude, parameters...)
+def fetch_region(lat_min, lat_max, lon_min, lon_max, date_str):
+    url = (
+        f"{BASE_URL}?parameters={PARAMETERS}"
+        f"&latitude-min={lat_min}&latitude-max={lat_max}&longitude-min={lon_min}&longitude-max={lon_max}"
+        f"&start={date_str}&end={date_str}&community={COMMUNITY}&format=JSON"
+    )
+    get_rate_limiter().acquire()
+    response = get_session().get(url, timeout=30)
+    response.raise_for_status()
+    rows = []
+    payload = orjson.loads(response.content) if orjson else response.json()
+    for feature in payload["features"]:
+        lon, lat = feature["geometry"]["coordinates"][:2]
+        values = feature["properties"]["parameter"]
+        rows.append({"Latitude": lat, "Longitude": lon, **{p: values[p][date_str] for p in PARAMETERS.split(",")}})
+    return pd.DataFrame(rows)
+
+def split_range(lo, hi):
+    """Split [lo, hi] into equal spans no wider than MAX_REGION_DEG"""
+    n = max(1, math.ceil((hi - lo) / MAX_REGION_DEG))
+    step = (hi - lo) / n
+    return [(round(lo + i * step, 3), round(lo + (i + 1) * step, 3)) for i in range(n)]
+
+class IncompleteGridError(Exception):
+    """A NASA POWER tile failed; raised so st.cache_data never memoizes the partial grid it carries"""
+    def __init__(self, grid):
+        super().__init__("NASA POWER climate grid is incomplete")
+        self.grid = grid
+
 # Function to fetch NASA POWER climate data
 @st.cache_data(show_spinner="Fetching Climate Data...")
-def fetch_nasa_data(locations, date):
+def fetch_nasa_data(bounds, date):
     date_str = date.strftime("%Y%m%d")
-    results = []
+    lon_min, lat_min, lon_max, lat_max = bounds = tuple(round(float(b), 3) for b in bounds)
     
-    def fetch(lat, lon):
-        url = f"{BASE_URL}?parameters={PARAMETERS}&latitude={lat}&longitude={lon}&start={date_str}&end={date_str}&community={COMMUNITY}&format=CSV"
-        response = requests.get(url)
-        if response.status_code == 200:
-            lines = response.text.splitlines()
-            header_end = next(i for i, line in enumerate(lines) if "-END HEADER-" in line)
-            df = pd.read_csv(io.StringIO("\n".join(lines[header_end + 1:])))
-            df[["Latitude", "Longitude"]] = lat, lon
-            return df
+    # Serve repeat views from disk so restarts do not re-download identical grids
+    key = hashlib.sha256(f"{date_str}|{bounds}".encode()).hexdigest()
+    cache_path = NASA_CACHE_DIR / f"{key}.parquet"
+    if NASA_CACHE_POLICY != "disabled" and cache_path.exists():
+        return pd.read_parquet(cache_path)
+    if NASA_CACHE_POLICY == "replay":
+        st.warning(f"⚠️ NASA_CACHE_POLICY is 'replay' and no cached climate grid exists for {date.strftime('%Y-%m-%d')}; the API is not called in replay mode.")
         return None
     
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = [executor.submit(fetch, lat, lon) for lat, lon in locations]
-        for future in concurrent.futures.as_completed(futures):
-            result = future.result()
-            if result is not None:
-                results.append(result)
+    results = []
+    complete = True
+    
+    for lat_lo, lat_hi in split_range(lat_min, lat_max):
+        for lon_lo, lon_hi in split_range(lon_min, lon_max):
+            try:
+                results.append(fetch_region(lat_lo, lat_hi, lon_lo, lon_hi, date_str))
+            except Exception as e:
+                st.warning(f"⚠️ Climate tile {lat_lo}–{lat_hi}°N, {lon_lo}–{lon_hi}°E failed: {e}")
+                complete = False
+                continue
+    
+    # Adjacent tiles share their edge cells, so collapse repeated grid points
+    result = (
+        pd.concat(results, ignore_index=True).groupby(["Latitude", "Longitude"], as_index=False).mean()
+        if results else None
+    )
     
-    return pd.concat(results, ignore_index=True) if results else None
+    # Exceptions are not cached, so a partial grid is neither memoized nor persisted and the next run retries
+    if not complete:
+        raise IncompleteGridError(result)
+    if NASA_CACHE_POLICY == "enabled":
+        NASA_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        result.to_parquet(cache_path, compression="zstd")
+    return result
 
-# Fetch climate data
-locations = list(gdf[["lat", "lon"]].drop_duplicates().itertuples(index=False, name=None))
-df = fetch_nasa_data(locations, date)
+# Fetch climate data for the whole shapefile extent as one regional grid
+try:
+    df = fetch_nasa_data(tuple(gdf.total_bounds), date)
+except IncompleteGridError as e:
+    df = e.grid  # Show what did arrive for this run only
 
 if df is not None:
-    gdf = gdf.merge(df, left_on=["lat", "lon"], right_on=["Latitude", "Longitude"], how="left")
-    gdf.rename(columns={"PRECTOTCORR": "Rainfall", "T2M": "LST", "RH2M": "Relative_H"}, inplace=True)
+    # Sample every ward centroid from its nearest grid cell into the NASA parameter columns.
+    # These only feed the climate layers: the model keeps the shapefile's Rainfall/LST/Relative_H,
+    # which are in the units the random forest was trained on (NASA's °C, % and mm/day are not)
+    tree = cKDTree(df[["Latitude", "Longitude"]].to_numpy())
+    dist, idx = tree.query(gdf[["lat", "lon"]].to_numpy(), k=1)
+    for col in CLIMATE_LAYERS.values():
+        gdf[col] = df[col].to_numpy()[idx]
+    
+    # A ward more than one grid step from every cell lies in a tile that failed; leave it blank
+    # rather than showing a neighbouring tile's values
+    far = dist > GRID_STEP_DEG
+    if far.any():
+        gdf.loc[far, list(CLIMATE_LAYERS.values())] = np.nan
+        st.warning(f"⚠️ No climate data for {int(far.sum())} wards outside the downloaded tiles.")
     
     # Fill missing values with 0 instead of mean
     gdf[["Rainfall", "LST", "Relative_H"]] = gdf[["Rainfall", "LST", "Relative_H"]].fillna(0)
 
-    # Ensure no duplicate column labels before reindexing
-    gdf = gdf.loc[:, ~gdf.columns.duplicated()]
-
-    # Feature selection and scaling
-    feature_columns = ["Rainfall", "LST", "Relative_H"]
-    X_pred = gdf[feature_columns].copy()
-
-    # Ensure feature names match and avoid errors
-    X_pred = X_pred.reindex(columns=scaler.feature_names_in_, fill_value=0)
+    # Feature matrix in training column order, built directly as contiguous float32
+    # (the random forest predicts in float32, so no upcast or extra copy is made)
+    X_pred = np.ascontiguousarray(
+        np.stack([gdf[c].to_numpy(dtype=np.float32) for c in scaler.feature_names_in_], axis=1)
+    )
 
-    # Transform and predict malaria cases
-    X_pred_scaled = scaler.transform(X_pred)
-    gdf["pred_cases"] = trained_model.predict(X_pred_scaled).astype(int)
+    # Standardize in place with the fitted scaler statistics, then predict all wards at once
+    X_pred -= scaler.mean_
+    X_pred /= scaler.scale_
+    gdf["pred_cases"] = trained_model.predict(X_pred).astype(int)
     
     # Assign climate values based on selection
-    gdf["climate_value"] = (
-        gdf["LST"] if selected_layer == "Temperature" else
-        gdf["Relative_H"] if selected_layer == "Humidity" else
-        gdf["Rainfall"] if selected_layer == "Precipitation" else
-        gdf["pred_cases"]
-    )
+    gdf["climate_value"] = gdf[CLIMATE_LAYERS.get(selected_layer, "pred_cases")]
+
+    # Define colormap (used for the legend)
+    vmin, vmax = gdf["climate_value"].min(), gdf["climate_value"].max()
+    colormap = LinearColormap(["blue", "cyan", "yellow", "orange", "red"], vmin=vmin, vmax=vmax)
 
-    # Define colormap
-    colormap = LinearColormap(["blue", "cyan", "yellow", "orange", "red"], vmin=gdf["climate_value"].min(), vmax=gdf["climate_value"].max())
+    # Precompute every ward's fill color in one vectorized pass over the color stops
+    v = (gdf["climate_value"].to_numpy(dtype=float) - vmin) / ((vmax - vmin) or 1)
+    missing = np.isnan(v)
+    v[missing] = 0
+    rgb = [HEX_BYTES[np.interp(v, COLOR_STOPS, COLOR_RGB[:, i]).round().astype(int)] for i in range(3)]
+    gdf["_fill"] = np.where(missing, MISSING_FILL, np.char.add(np.char.add(np.char.add("#", rgb[0]), rgb[1]), rgb[2]))
 
     # Folium Map
     m = folium.Map(location=[gdf["lat"].mean(), gdf["lon"].mean()], zoom_start=6)
 
-    # Function to apply correct color mapping (Fix KeyError)
+    # Style reads the precomputed color, so no colormap math runs per feature
     def style_function(feature):
-        # Extract value safely from feature properties, default to 0 if missing
-        value = feature.get("properties", {}).get("climate_value", 0)
-        return {"fillColor": colormap(value), "color": "black", "weight": 1, "fillOpacity": 0.7}
+        return {"fillColor": feature["properties"]["_fill"], "color": "black", "weight": 1, "fillOpacity": 0.7}
 
-    # Convert GeoDataFrame to GeoJSON and add to map
+    # Convert GeoDataFrame to GeoJSON and add to map; only the properties the map reads are
+    # serialized, not the ~20 shapefile attribute columns carried by every ward
     folium.GeoJson(
-        gdf,
+        gdf[["geometry", "climate_value", "_fill"]],
         name=selected_layer,
         style_function=style_function,
         tooltip=folium.GeoJsonTooltip(fields=["climate_value"], aliases=[f"{selected_layer}:"]),
@@ -1,26 +1,36 @@
 import streamlit as st
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
 import joblib
+import hashlib
 import os
+import tempfile
 import gc
+import json
+import threading
 import sys
-from stable_baselines3 import PPO
-from stable_baselines3.common.vec_env import DummyVecEnv
 from datetime import datetime
-import gymnasium as gym  # Updated to Gymnasium
-from gymnasium import spaces
-
-# Lazy import torch to avoid Streamlit file watcher issues
-try:
-    import torch
-except Exception:
-    torch = None
 
 # CONFIGURATION: Online retraining DISABLED due to Streamlit Cloud incompatibility
 # PyTorch RL training causes segmentation faults in cloud environments
 # Use offline retraining instead (see RETRAINING_GUIDE.md)
 ENABLE_RETRAINING = os.getenv('ENABLE_RETRAINING', 'False').lower() == 'true'
+RETRAIN_INTERVAL = int(os.getenv('RETRAIN_INTERVAL', '5'))  # Retrain once every N saved records
+TRAINING_ENVS = 16  # Batched env copies stepped together during retraining
+RETRAIN_TIMESTEPS = 200  # Ultra-low timesteps per retrain for cloud deployment (reduces memory pressure)
+ROLLOUT_SIZE = -(-RETRAIN_TIMESTEPS // TRAINING_ENVS) * TRAINING_ENVS  # One rollout covers a whole retrain
+
+# Lazy import torch: only needed for online retraining (also avoids Streamlit file watcher issues);
+# predictions run on the exported NumPy policy, so stable_baselines3/gymnasium load on demand too
+torch = None
+if ENABLE_RETRAINING:
+    try:
+        import torch
+        torch.set_num_threads(1)  # Tiny MLP updates: extra intra-op threads only contend with Streamlit's
+    except Exception:
+        torch = None
 
 # Warn if torch import failed
 if ENABLE_RETRAINING and torch is None:
@@ -40,54 +50,165 @@ else:
 MODEL_PATH = 'models/ppo_malaria2'  # Ensure it matches the training script
 SCALER_PATH = 'models/scaler2.pkl'
 DATA_PATH = 'test_records.csv'
+POLICY_PATH = f'{MODEL_PATH}_policy.npz'  # Actor weights exported from the PPO zip for inference
 
-# Load trained PPO model and scaler
-model = PPO.load(MODEL_PATH)
-scaler = joblib.load(SCALER_PATH)
+# Full PPO model (cached per process), only needed for retraining and policy export;
+# the cached training env is bound once at load instead of on every retrain
+@st.cache_resource
+def get_model():
+    from stable_baselines3 import PPO
+    if not ENABLE_RETRAINING:
+        return PPO.load(MODEL_PATH, device='cpu')
+    # Size the rollout and minibatch to the retrain budget: learn() then fills one small buffer and
+    # runs a single full-batch update instead of collecting the saved models' 2048-sample rollout
+    return PPO.load(MODEL_PATH, env=get_training_env(), device='cpu',
+                    custom_objects={'n_steps': ROLLOUT_SIZE // TRAINING_ENVS, 'batch_size': ROLLOUT_SIZE})
+
+# Fitted StandardScaler (cached per process)
+@st.cache_resource
+def get_scaler():
+    return joblib.load(SCALER_PATH)
+
+scaler = get_scaler()
+SCALER_MEAN = scaler.mean_.astype(np.float32)
+SCALER_INV_SCALE = (1.0 / scaler.scale_).astype(np.float32)  # Multiply instead of divide when scaling
+
+# Actor layers of SB3's default MlpPolicy (two 64-unit Tanh layers, then the action head)
+POLICY_LAYERS = ['mlp_extractor.policy_net.0', 'mlp_extractor.policy_net.2', 'action_net']
+
+def model_digest():
+    """SHA-256 of the PPO zip; git does not keep mtimes, so this is what ties a policy to its model"""
+    with open(f'{MODEL_PATH}.zip', 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def export_policy(ppo_model):
+    """Save only the actor weights of a PPO model (plus the zip's digest) to POLICY_PATH as float32 (in, out) matrices"""
+    state_dict = ppo_model.policy.state_dict()
+    weights = {}
+    for i, layer in enumerate(POLICY_LAYERS, start=1):
+        weights[f'W{i}'] = state_dict[f'{layer}.weight'].cpu().numpy().T.astype(np.float32)
+        weights[f'b{i}'] = state_dict[f'{layer}.bias'].cpu().numpy().astype(np.float32)
+    # Unique temp file, so the UI thread and the retrain worker never write over each other's export
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(POLICY_PATH), suffix='.npz', delete=False) as tmp:
+        np.savez(tmp, source=np.array(model_digest()), **weights)
+    os.replace(tmp.name, POLICY_PATH)  # Readers never see a half-written file
+
+# Inference weights (cached per process); re-exported whenever they were not exported from the current PPO zip
+@st.cache_resource
+def get_policy():
+    source = None
+    if os.path.exists(POLICY_PATH):
+        with np.load(POLICY_PATH) as weights:
+            source = str(weights['source']) if 'source' in weights.files else None
+    if source != model_digest():
+        export_policy(get_model())
+    with np.load(POLICY_PATH) as weights:
+        return tuple(np.ascontiguousarray(weights[k]) for k in ('W1', 'b1', 'W2', 'b2', 'W3', 'b3'))
+
+def predict_actions(X, policy):
+    """Scale raw symptom rows and run the actor MLP in one NumPy pass; returns 1 for Positive per row"""
+    W1, b1, W2, b2, W3, b3 = policy
+    z = (X - SCALER_MEAN) * SCALER_INV_SCALE
+    h = np.tanh(z @ W1 + b1)
+    h = np.tanh(h @ W2 + b2)
+    logits = h @ W3 + b3
+    return (logits[:, 1] > logits[:, 0]).astype(np.int8)  # Same tie-break as argmax / deterministic PPO.predict
+
+# The deterministic policy over 10 binary symptoms is a 1024-entry table: evaluate every
+# combination once per policy (row i = bits of i) and rebuild when get_policy is cleared
+@st.cache_resource
+def get_action_table():
+    codes = np.arange(2 ** len(features))[:, None]
+    X = ((codes >> np.arange(len(features))) & 1).astype(np.float32)
+    return predict_actions(X, get_policy())
 
 # Define symptom features
 features = ['chill_cold', 'headache', 'fever', 'generalized body pain',
             'abdominal pain', 'Loss of appetite', 'joint pain', 'vomiting',
             'nausea', 'diarrhea']
+FEATURE_BIT = {f: 1 << i for i, f in enumerate(features)}  # Symptom name -> its bit in the symptom bitmask
+FEATURE_SHIFTS = np.arange(len(features))  # Unpacks a bitmask into the 0/1 feature vector
+
+# Parse the records file; the mtime argument invalidates the cache whenever the file changes
+@st.cache_data(ttl=60)
+def _read_records(mtime):
+    # pyarrow's multithreaded parser; every column stays text (IDs keep leading zeros, blanks stay null)
+    # and the repeated outcome labels are dictionary-encoded (categoricals in pandas)
+    columns = ['Date', 'Patient ID', 'Symptoms', 'Predicted Case', 'Actual Case']
+    column_types = dict.fromkeys(columns, pa.string())
+    column_types.update(dict.fromkeys(['Predicted Case', 'Actual Case'], pa.dictionary(pa.int32(), pa.string())))
+    convert = pv.ConvertOptions(column_types=column_types, strings_can_be_null=True)
+    return pv.read_csv(DATA_PATH, convert_options=convert).to_pandas()
 
 # Load existing data or create an empty DataFrame
 def load_data():
     if os.path.exists(DATA_PATH):
-        return pd.read_csv(DATA_PATH)
+        return _read_records(os.path.getmtime(DATA_PATH))
     else:
         return pd.DataFrame(columns=['Date', 'Patient ID', 'Symptoms', 'Predicted Case', 'Actual Case'])
 
+# Record dates as datetime64[D] in file order, parsed once per file version (both date styles in
+# the file, '4/7/2025' and '2025-04-08 10:15:00', parse; invalid dates become NaT)
+def parse_days(dates):
+    return pd.to_datetime(dates, errors='coerce', format='mixed').to_numpy(dtype='datetime64[D]')
+
+@st.cache_data(ttl=60)
+def _record_days(mtime):
+    return parse_days(load_data()['Date'])
+
+# CSV/TSV bytes for downloads via pyarrow's C++ writer (UTF-8, no index)
+def to_delimited(df, delimiter):
+    buffer = pa.BufferOutputStream()
+    pv.write_csv(pa.Table.from_pandas(df, preserve_index=False), buffer,
+                 write_options=pv.WriteOptions(delimiter=delimiter))
+    return buffer.getvalue().to_pybytes()
+
 def save_data(new_entry):
-    """Save patient data with validation for clinical trials"""
-    df = load_data()
-    df = pd.concat([df, new_entry], ignore_index=True)
-    df.to_csv(DATA_PATH, index=False)
-    return len(df)  # Return total count
-
-# Custom Gymnasium Environment for Malaria Prediction
-class MalariaEnv(gym.Env):
-    def __init__(self):
-        super(MalariaEnv, self).__init__()
-        self.observation_space = spaces.Box(low=-1, high=1, shape=(10,), dtype=np.float32)  # Match trained model
-        self.action_space = spaces.Discrete(2)  # Binary classification (0=Negative, 1=Positive)
-        self.state = np.zeros(10, dtype=np.float32)
-        self.done = False
-
-    def reset(self, seed=None, options=None):
-        self.state = np.random.uniform(-1, 1, size=(10,)).astype(np.float32)  # Match trained model
-        self.done = False
-        return self.state, {}  # Gymnasium requires returning (obs, info)
-
-    def step(self, action):
-        reward = 1 if (action == 1 and np.sum(self.state) > 5) else -1  # Reward logic
-        self.done = True
-        return self.state, reward, self.done, False, {}  # Gymnasium requires (obs, reward, done, truncated, info)
-
-    def render(self, mode='human'):
-        pass
-
-    def close(self):
-        pass
+    """Append patient data for clinical trials without rewriting existing records"""
+    new_entry.to_csv(DATA_PATH, mode='a', header=not os.path.exists(DATA_PATH), index=False)
+    return len(load_data())  # Return total count
+
+# Training env is reused across retrains instead of being rebuilt each time; all copies
+# step in one NumPy call, so rollouts need one policy forward per TRAINING_ENVS samples
+@st.cache_resource
+def get_training_env():
+    from malaria_env import MalariaVecEnv
+    return MalariaVecEnv(num_envs=TRAINING_ENVS)
+
+# At most one background retrain per process
+@st.cache_resource
+def get_retrain_lock():
+    return threading.Lock()
+
+# Outcome of the last background retrain, shared across sessions so a failure is shown on the next rerun
+@st.cache_resource
+def get_retrain_status():
+    return {}
+
+def _retrain_worker(model, lock, status):
+    """Run PPO updates off the UI thread, then swap in the new model zip and policy atomically"""
+    try:
+        model.learn(total_timesteps=RETRAIN_TIMESTEPS, progress_bar=False)
+
+        # Save to a unique temp zip beside the model, then swap it in atomically
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(MODEL_PATH), suffix='.zip')
+        os.close(fd)
+        model.save(tmp_path)
+        os.replace(tmp_path, f'{MODEL_PATH}.zip')
+        export_policy(model)
+        get_policy.clear()
+        get_action_table.clear()
+
+        # Clear PyTorch cache if using CUDA
+        if torch and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+        # Force Python garbage collection
+        gc.collect()
+    except Exception as e:
+        status['error'] = str(e)
+    finally:
+        lock.release()
 
 # Function to retrain the model
 def retrain_model():
@@ -97,52 +218,26 @@ def retrain_model():
     # Check if retraining is enabled
     if not ENABLE_RETRAINING:
         # Just save the data - retraining will be done offline
-        if len(df) >= 5 and len(df) % 5 == 0:
+        if len(df) >= RETRAIN_INTERVAL and len(df) % RETRAIN_INTERVAL == 0:
             st.info(f"📊 {len(df)} samples collected. Data saved for offline model retraining.")
             st.info("💡 Online retraining is disabled to prevent memory issues in cloud deployment.")
         return
     
-    # Only retrain at specific intervals (5, 10, 15, etc.) to prevent continuous retraining
-    if len(df) >= 5 and len(df) % 5 == 0:  # Retrain every 5 samples
+    # Only retrain at specific intervals (every RETRAIN_INTERVAL samples) to prevent continuous retraining
+    if len(df) >= RETRAIN_INTERVAL and len(df) % RETRAIN_INTERVAL == 0:
+        lock = get_retrain_lock()
+        if not lock.acquire(blocking=False):
+            st.info("⏳ A retraining run is already in progress; the new data will be used by the next run.")
+            return
         try:
             st.warning("⚠️ Retraining enabled - this may cause crashes in cloud environments!")
             
-            # Convert Symptoms column from string to list of numbers
-            X = np.array([eval(symptoms) for symptoms in df['Symptoms']])  # Convert from string to list
-            X = np.squeeze(X)  # Remove extra dimensions if present
-
-            # Ensure X is 2D with shape (n_samples, n_features)
-            if X.ndim == 1:
-                X = X.reshape(1, -1)
-
-            X_df = pd.DataFrame(X, columns=features)  # Convert to DataFrame
-            X_scaled = scaler.transform(X_df)  # Scale features
-
-            # Set up RL environment with minimal timesteps for cloud stability
-            env = DummyVecEnv([lambda: MalariaEnv()])
-            model.set_env(env)
-            
-            # Ultra-low timesteps for cloud deployment (200 instead of 500/1000)
-            # This reduces memory pressure significantly
-            model.learn(total_timesteps=200, progress_bar=False)
-
-            model.save(MODEL_PATH)
-            
-            # Aggressive resource cleanup to prevent memory leaks
-            env.close()
-            del env
-            
-            # Clear PyTorch cache if using CUDA
-            if torch and torch.cuda.is_available():
-                torch.cuda.empty_cache()
-            
-            # Force Python garbage collection
-            gc.collect()
-            
-            st.success(f"✅ Model retrained successfully after {len(df)} samples!")
-            st.info("💾 Memory cleaned up to prevent crashes.")
-            
+            # Model already carries the training env; train in a daemon thread so the page returns immediately.
+            # Once started, the worker owns the lock and releases it when it finishes
+            model = get_model()
+            threading.Thread(target=_retrain_worker, args=(model, lock, get_retrain_status()), daemon=True).start()
         except Exception as e:
+            lock.release()
             st.error(f"❌ Error during retraining: {str(e)}")
             st.warning("⚠️ Prediction will continue with the existing model.")
             
@@ -153,13 +248,22 @@ def retrain_model():
                     torch.cuda.empty_cache()
             except:
                 pass
+            return
+        
+        st.success(f"🔄 Retraining started in the background after {len(df)} samples.")
+        st.info("💡 Predictions use the current model until the new one is saved.")
 
 # Initialize session state
 if 'patient_id' not in st.session_state:
     st.session_state['patient_id'] = None
-    st.session_state['features'] = None
+    st.session_state['sym_bits'] = None
     st.session_state['predicted_case'] = None
-    st.session_state['last_retrain_count'] = 0  # Track last retrain to avoid duplicate retrains
+
+# Report a background retrain that failed since the last rerun (shown once)
+retrain_error = get_retrain_status().pop('error', None)
+if retrain_error:
+    st.error(f"❌ Background retraining failed: {retrain_error}")
+    st.warning("⚠️ Prediction will continue with the existing model.")
 
 # Streamlit Sidebar
 st.sidebar.title("Navigation")
@@ -170,31 +274,30 @@ if page == "Symptom Input":
     st.title("Malaria Prediction - RL Model")
     st.write("Select your symptoms and get a prediction.")
 
-    # Patient ID Input
-    patient_id = st.text_input("Patient ID", "")
-
-    # Symptom Selection using Yes/No Buttons
-    selected_features = {}
-    for feature in features:
-        response = st.radio(f"Do you have {feature.replace('_', ' ')}?", ["No", "Yes"], horizontal=True)
-        selected_features[feature] = 1 if response == "Yes" else 0
-
-    if st.button("Predict Malaria"):
+    # Patient ID and symptoms live in one form, so the script only reruns on submit
+    with st.form("symptoms"):
+        patient_id = st.text_input("Patient ID", "")
+        selected = st.multiselect(
+            "Select all symptoms present",
+            options=features,
+            format_func=lambda f: f.replace('_', ' ').capitalize()
+        )
+        submitted = st.form_submit_button("Predict Malaria")
+
+    if submitted:
         if not patient_id:
             st.warning("Please enter a Patient ID.")
         else:
-            # Convert selected symptoms to numeric array
-            feature_values = np.array([selected_features[f] for f in features]).reshape(1, -1)
-            feature_df = pd.DataFrame(feature_values, columns=features)  # Convert to DataFrame
-            scaled_values = scaler.transform(feature_df)  # Ensure correct input format
+            # Selected symptoms as one bitmask (bit i = features[i]), which is also the action-table row
+            sym_bits = sum(FEATURE_BIT[f] for f in selected)
 
-            # RL Model Predicts Action
-            action, _ = model.predict(scaled_values)
-            predicted_case = "Positive (1)" if action[0] == 1 else "Negative (0)"
+            # RL policy's action for this symptom combination, read from the precomputed table
+            action = int(get_action_table()[sym_bits])
+            predicted_case = "Positive (1)" if action == 1 else "Negative (0)"
 
             # Store patient data in session state
             st.session_state['patient_id'] = patient_id
-            st.session_state['features'] = feature_values.tolist()
+            st.session_state['sym_bits'] = sym_bits
             st.session_state['predicted_case'] = predicted_case
 
             st.write(f"### Predicted Case: {predicted_case}")
@@ -214,10 +317,12 @@ if page == "Test Result & Download Data":
         actual_cases = st.radio("Clinic Test Result", ["Positive (1)", "Negative (0)"])
 
         if st.button("Submit & Save Test Record"):
+            # Stored symptom list ('[[0, 1, ...]]') is unpacked from the bitmask only when a record is saved
+            feature_values = ((st.session_state['sym_bits'] >> FEATURE_SHIFTS) & 1).reshape(1, -1)
             new_entry = pd.DataFrame({
                 'Date': [datetime.now().strftime('%Y-%m-%d %H:%M:%S')],  # Include timestamp
                 'Patient ID': [st.session_state['patient_id']],
-                'Symptoms': [str(st.session_state['features'])],
+                'Symptoms': [json.dumps(feature_values.tolist())],
                 'Predicted Case': [st.session_state['predicted_case']],
                 'Actual Case': [actual_cases]
             })
@@ -237,7 +342,7 @@ if page == "Test Result & Download Data":
             
             # Reset session state for next patient
             st.session_state['patient_id'] = None
-            st.session_state['features'] = None
+            st.session_state['sym_bits'] = None
             st.session_state['predicted_case'] = None
 
     # Data Filtering & Download
@@ -248,14 +353,19 @@ if page == "Test Result & Download Data":
         st.warning("No records found.")
     else:
         # Show summary statistics
+        # Count each distinct label once (the column is categorical) and match on the labels, not every row
+        positive_count = negative_count = 0
+        if 'Actual Case' in df.columns:
+            label_counts = df['Actual Case'].value_counts()
+            labels = label_counts.index.astype(str)
+            positive_count = int(label_counts[labels.str.contains('Positive')].sum())
+            negative_count = int(label_counts[labels.str.contains('Negative')].sum())
         col1, col2, col3 = st.columns(3)
         with col1:
             st.metric("Total Records", len(df))
         with col2:
-            positive_count = df['Actual Case'].str.contains('Positive').sum() if 'Actual Case' in df.columns else 0
             st.metric("Positive Cases", positive_count)
         with col3:
-            negative_count = df['Actual Case'].str.contains('Negative').sum() if 'Actual Case' in df.columns else 0
             st.metric("Negative Cases", negative_count)
         
         st.markdown("---")
@@ -265,8 +375,11 @@ if page == "Test Result & Download Data":
             filtered_df = df
         elif filter_option == "Date":
             selected_date = st.date_input("Select Date")
-            # Handle both date formats (with and without time)
-            filtered_df = df[df['Date'].str.contains(selected_date.strftime('%Y-%m-%d'))]
+            # Handle both date formats (with and without time) by comparing parsed days
+            days = _record_days(os.path.getmtime(DATA_PATH))
+            if len(days) != len(df):  # File changed since df was loaded
+                days = parse_days(df['Date'])
+            filtered_df = df[days == np.datetime64(selected_date, 'D')]
         else:
             selected_patient = st.text_input("Enter Patient ID")
             filtered_df = df[df['Patient ID'] == selected_patient]
@@ -274,23 +387,21 @@ if page == "Test Result & Download Data":
         if not filtered_df.empty:
             st.dataframe(filtered_df, use_container_width=True)
             
-            # Multiple download formats
-            col1, col2 = st.columns(2)
-            with col1:
-                csv = filtered_df.to_csv(index=False).encode('utf-8')
+            # Multiple download formats; only the chosen one is encoded on each rerun
+            export_format = st.radio("Download Format:", ["CSV", "TSV (Excel)"], horizontal=True)
+            if export_format == "CSV":
                 st.download_button(
                     "📥 Download as CSV", 
-                    csv, 
+                    to_delimited(filtered_df, ','), 
                     f"malaria_trial_data_{datetime.now().strftime('%Y%m%d')}.csv", 
                     "text/csv",
                     use_container_width=True
                 )
-            with col2:
+            else:
                 # Download as Excel-compatible format
-                excel_csv = filtered_df.to_csv(index=False, sep='\t').encode('utf-8')
                 st.download_button(
                     "📊 Download as TSV (Excel)", 
-                    excel_csv, 
+                    to_delimited(filtered_df, '\t'), 
                     f"malaria_trial_data_{datetime.now().strftime('%Y%m%d')}.tsv", 
                     "text/tab-separated-values",
                     use_container_width=True
@@ -5,8 +5,12 @@ Provides data management, validation, and helper functions
 
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pv
 import os
 import json
+import shutil
+import threading
 from datetime import datetime
 from typing import Optional, Tuple, List, Dict
 import streamlit as st
@@ -16,22 +20,49 @@ from config import Config
 class DataManager:
     """Manages data loading, saving, and validation"""
     
+    # Serializes appends and backup copies across sessions (this module is imported once per process)
+    _write_lock = threading.Lock()
+    # (data file mtime, record count) after the last save, so counts are not re-derived per save
+    _record_count = (None, 0)
+    # Column types for reading the CSV: text everywhere, outcome labels dictionary-encoded
+    # (they repeat on every row, so pandas gets categoricals and string ops run once per label)
+    _column_types = {
+        **dict.fromkeys(Config.CSV_COLUMNS, pa.string()),
+        **dict.fromkeys(['Predicted Case', 'Actual Case'], pa.dictionary(pa.int32(), pa.string()))
+    }
+    
     @staticmethod
     def load_data() -> pd.DataFrame:
         """
-        Load patient data from CSV file
+        Load patient data from CSV file with pyarrow's multithreaded parser
+        All columns are read as text, so IDs keep leading zeros and dates are not re-typed;
+        outcome labels come back as categoricals
+        Parsed once per file version (cached on mtime, so every save invalidates it)
         Returns empty DataFrame with proper columns if file doesn't exist
         """
         if os.path.exists(Config.DATA_PATH):
             try:
-                df = pd.read_csv(Config.DATA_PATH)
-                return df
+                return DataManager._read_records(DataManager._data_mtime())
             except Exception as e:
                 st.error(f"❌ Error loading data: {str(e)}")
                 return pd.DataFrame(columns=Config.CSV_COLUMNS)
         else:
             return pd.DataFrame(columns=Config.CSV_COLUMNS)
     
+    @staticmethod
+    @st.cache_data(ttl=60, show_spinner=False)
+    def _read_records(mtime: float) -> pd.DataFrame:
+        """Parse the data file; mtime is only the cache key"""
+        table = pv.read_csv(
+            Config.DATA_PATH,
+            read_options=pv.ReadOptions(encoding=Config.CSV_ENCODING),
+            convert_options=pv.ConvertOptions(
+                column_types=DataManager._column_types,
+                strings_can_be_null=True
+            )
+        )
+        return table.to_pandas()
+    
     @staticmethod
     def save_data(new_entry: pd.DataFrame) -> Tuple[bool, int, str]:
         """
@@ -44,35 +75,80 @@ class DataManager:
             Tuple of (success, total_records, message)
         """
         try:
-            df = DataManager.load_data()
+            with DataManager._write_lock:
+                mtime_before = DataManager._data_mtime()
+                
+                # Append only the new rows (header only for a new file), in the file's column order
+                new_entry.reindex(columns=Config.CSV_COLUMNS).to_csv(
+                    Config.DATA_PATH,
+                    mode='a',
+                    header=not os.path.exists(Config.DATA_PATH),
+                    index=False,
+                    encoding=Config.CSV_ENCODING
+                )
+                
+                # Extend the known count if nothing else touched the file since the last save
+                last_mtime, last_count = DataManager._record_count
+                if last_mtime == mtime_before:
+                    total_records = last_count + len(new_entry)
+                else:
+                    total_records = DataManager._count_records()
+                DataManager._record_count = (DataManager._data_mtime(), total_records)
             
-            # Create backup before saving
-            DataManager._create_backup(df)
+            # One backup per day, taken off the request path by the first save of the day
+            if not os.path.exists(DataManager._daily_backup_path()):
+                threading.Thread(target=DataManager._create_backup, daemon=True).start()
             
-            # Append new entry
-            df = pd.concat([df, new_entry], ignore_index=True)
-            
-            # Save to CSV
-            df.to_csv(Config.DATA_PATH, index=False, encoding=Config.CSV_ENCODING)
-            
-            return True, len(df), "Data saved successfully"
+            return True, total_records, "Data saved successfully"
             
         except Exception as e:
             return False, 0, f"Error saving data: {str(e)}"
     
     @staticmethod
-    def _create_backup(df: pd.DataFrame):
-        """Create backup of current data"""
+    def export_delimited(df: pd.DataFrame, delimiter: str = ',') -> bytes:
+        """
+        Serialize records to CSV/TSV bytes with pyarrow's C++ writer (UTF-8, no index)
+        
+        Args:
+            df: Records to export
+            delimiter: ',' for CSV, '\\t' for TSV
+            
+        Returns:
+            Encoded file contents for st.download_button
+        """
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        buffer = pa.BufferOutputStream()
+        pv.write_csv(table, buffer, write_options=pv.WriteOptions(delimiter=delimiter))
+        return buffer.getvalue().to_pybytes()
+    
+    @staticmethod
+    def _count_records() -> int:
+        """Count data rows by scanning line breaks (no CSV parsing); 0 if the file is missing"""
+        if not os.path.exists(Config.DATA_PATH):
+            return 0
+        with open(Config.DATA_PATH, 'rb') as f:
+            lines = sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b''))
+        return max(lines - 1, 0)  # Minus the header row
+    
+    @staticmethod
+    def _daily_backup_path() -> str:
+        """Path of today's backup file"""
+        return os.path.join(Config.BACKUP_DIR, f"backup_{datetime.now().strftime('%Y%m%d')}.csv")
+    
+    @staticmethod
+    def _create_backup():
+        """Create today's backup of current data if missing (file copy, no CSV round-trip)"""
         try:
             Config.create_directories()
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            backup_path = os.path.join(Config.BACKUP_DIR, f'backup_{timestamp}.csv')
+            backup_path = DataManager._daily_backup_path()
             
-            # Only keep last 10 backups
-            DataManager._cleanup_old_backups()
+            with DataManager._write_lock:
+                if os.path.exists(backup_path) or not os.path.exists(Config.DATA_PATH):
+                    return
+                shutil.copyfile(Config.DATA_PATH, backup_path)
             
-            if not df.empty:
-                df.to_csv(backup_path, index=False, encoding=Config.CSV_ENCODING)
+            # Only keep last 10 backups (days)
+            DataManager._cleanup_old_backups()
         except Exception:
             pass  # Silent fail for backups
     
@@ -83,15 +159,25 @@ class DataManager:
             if not os.path.exists(Config.BACKUP_DIR):
                 return
             
-            backups = [f for f in os.listdir(Config.BACKUP_DIR) if f.startswith('backup_')]
-            backups.sort(reverse=True)
+            # scandir entries carry their full path, so no per-file join or extra stat
+            with os.scandir(Config.BACKUP_DIR) as entries:
+                backups = sorted(
+                    (entry for entry in entries if entry.name.startswith('backup_')),
+                    key=lambda entry: entry.name,
+                    reverse=True
+                )
             
             # Remove old backups
             for old_backup in backups[keep_last:]:
-                os.remove(os.path.join(Config.BACKUP_DIR, old_backup))
+                os.unlink(old_backup.path)
         except Exception:
             pass
     
+    @staticmethod
+    def _data_mtime() -> float:
+        """Modification time of the data file (0 if missing), used as a cache key"""
+        return os.path.getmtime(Config.DATA_PATH) if os.path.exists(Config.DATA_PATH) else 0.0
+    
     @staticmethod
     def check_duplicate_patient(patient_id: str) -> Tuple[bool, Optional[str]]:
         """
@@ -100,23 +186,88 @@ class DataManager:
         Returns:
             Tuple of (is_duplicate, last_entry_date)
         """
+        patient_index = DataManager._patient_index(DataManager._data_mtime())
+        return patient_id in patient_index, patient_index.get(patient_id)
+    
+    @staticmethod
+    @st.cache_resource(max_entries=1, show_spinner=False)
+    def _patient_index(mtime: float) -> Dict[str, str]:
+        """
+        Map each Patient ID to the date of its latest record; mtime is only the cache key.
+        Shared read-only (cache_resource), so lookups do not copy the index.
+        """
         df = DataManager.load_data()
         
         if df.empty:
-            return False, None
+            return {}
         
-        # Check for exact patient ID match
-        patient_records = df[df['Patient ID'] == patient_id]
+        # Later rows overwrite earlier ones, so each ID keeps its most recent date
+        return dict(zip(df['Patient ID'].astype(str), df['Date']))
+    
+    @staticmethod
+    def filter_by_patient_id(df: pd.DataFrame, query: str) -> pd.DataFrame:
+        """
+        Case-insensitive substring match on Patient ID (plain text, no regex)
         
-        if not patient_records.empty:
-            last_date = patient_records.iloc[-1]['Date']
-            return True, last_date
+        Args:
+            df: Records as returned by load_data
+            query: Text typed into the Patient ID filter
+            
+        Returns:
+            Matching rows of df
+        """
+        pid_upper = DataManager._patient_ids_upper(DataManager._data_mtime())
+        if len(pid_upper) != len(df):
+            pid_upper = df['Patient ID'].fillna('').astype(str).str.upper()
+        mask = pid_upper.str.contains(query.upper(), regex=False, na=False).to_numpy()
+        return df[mask]
+    
+    @staticmethod
+    @st.cache_resource(max_entries=1, show_spinner=False)
+    def _patient_ids_upper(mtime: float) -> pd.Series:
+        """Upper-cased Patient IDs in file order, built once per data file version"""
+        return DataManager.load_data()['Patient ID'].fillna('').astype(str).str.upper()
+    
+    @staticmethod
+    def filter_by_date_range(df: pd.DataFrame, start_date, end_date) -> pd.DataFrame:
+        """
+        Keep records whose Date falls within [start_date, end_date] (inclusive, by day)
         
-        return False, None
+        Args:
+            df: Records as returned by load_data
+            start_date: First day to include
+            end_date: Last day to include
+            
+        Returns:
+            Matching rows of df (rows with unparseable dates are dropped)
+        """
+        days = DataManager._record_days(DataManager._data_mtime())
+        if len(days) != len(df):
+            days = DataManager._parse_days(df['Date'])
+        mask = (days >= np.datetime64(start_date, 'D')) & (days <= np.datetime64(end_date, 'D'))
+        return df[mask]
+    
+    @staticmethod
+    @st.cache_resource(max_entries=1, show_spinner=False)
+    def _record_days(mtime: float) -> np.ndarray:
+        """Record dates as datetime64[D] in file order, parsed once per data file version"""
+        return DataManager._parse_days(DataManager.load_data()['Date'])
+    
+    @staticmethod
+    def _parse_days(dates: pd.Series) -> np.ndarray:
+        """Parse mixed date strings (e.g. '4/7/2025', '2025-04-08 10:15:00') to datetime64[D]; NaT if invalid"""
+        parsed = pd.to_datetime(dates, errors='coerce', format='mixed', cache=True)
+        return parsed.to_numpy(dtype='datetime64[D]')
     
     @staticmethod
     def get_statistics() -> Dict:
-        """Get summary statistics from collected data"""
+        """Get summary statistics from collected data (recomputed only when the data file changes)"""
+        return DataManager._compute_statistics(DataManager._data_mtime())
+    
+    @staticmethod
+    @st.cache_data(show_spinner=False)
+    def _compute_statistics(mtime: float) -> Dict:
+        """Compute summary statistics; mtime is only the cache key"""
         df = DataManager.load_data()
         
         if df.empty:
@@ -128,23 +279,19 @@ class DataManager:
                 'recent_entries': []
             }
         
-        # Count positive and negative cases
-        positive_count = df['Actual Case'].str.contains('Positive', na=False).sum()
-        negative_count = df['Actual Case'].str.contains('Negative', na=False).sum()
+        # Label masks as NumPy booleans, each computed once and shared by the counts and the accuracy
+        actual_positive = df['Actual Case'].str.contains('Positive', na=False).to_numpy(dtype=bool)
+        actual_negative = df['Actual Case'].str.contains('Negative', na=False).to_numpy(dtype=bool)
+        pred_positive = df['Predicted Case'].str.contains('Positive', na=False).to_numpy(dtype=bool)
         
-        # Calculate accuracy
-        correct_predictions = 0
-        total_with_results = 0
+        # Count positive and negative cases
+        positive_count = actual_positive.sum()
+        negative_count = actual_negative.sum()
         
-        for _, row in df.iterrows():
-            if pd.notna(row['Predicted Case']) and pd.notna(row['Actual Case']):
-                total_with_results += 1
-                pred = '1' if 'Positive' in str(row['Predicted Case']) else '0'
-                actual = '1' if 'Positive' in str(row['Actual Case']) else '0'
-                if pred == actual:
-                    correct_predictions += 1
+        # Calculate accuracy over rows that have both a prediction and a result
+        valid = (df['Predicted Case'].notna() & df['Actual Case'].notna()).to_numpy()
         
-        accuracy = (correct_predictions / total_with_results * 100) if total_with_results > 0 else 0.0
+        accuracy = (pred_positive[valid] == actual_positive[valid]).mean() * 100 if valid.any() else 0.0
         
         # Get recent entries
         recent = df.tail(5)[['Date', 'Patient ID', 'Predicted Case', 'Actual Case']].to_dict('records')
@@ -194,6 +341,40 @@ class SymptomProcessor:
             st.error(f"Error parsing symptoms: {str(e)}")
             return None
     
+    @staticmethod
+    def parse_symptom_matrix(symptoms: pd.Series) -> np.ndarray:
+        """
+        Parse a whole column of stored symptom lists in one pass
+        
+        Args:
+            symptoms: Symptoms column ('[[0, 1, ...]]' or '[0, 1, ...]' per row)
+            
+        Returns:
+            float32 array of shape (n_records, n_features)
+            
+        Raises:
+            ValueError: if any row is blank or not a list of numbers
+        """
+        rows = symptoms.astype(str)
+        # Every row must hold exactly one value per feature, or the flat parse would shift values between rows
+        bad_rows = np.flatnonzero(rows.str.count(',').to_numpy() + 1 != len(Config.FEATURES))
+        if bad_rows.size:
+            row = bad_rows[0]
+            raise ValueError(
+                f"Symptom list in row {symptoms.index[row]!r} does not have "
+                f"{len(Config.FEATURES)} values: {rows.iloc[row]!r}"
+            )
+        
+        text = ' '.join(rows).translate(str.maketrans('[],', '   '))
+        values = np.fromstring(text, dtype=np.float32, sep=' ')
+        # fromstring stops quietly at the first unparsable token, so check every row was consumed
+        if values.size != len(symptoms) * len(Config.FEATURES):
+            raise ValueError(
+                f"Expected {len(symptoms)} symptom lists of {len(Config.FEATURES)} values, "
+                f"parsed {values.size} values"
+            )
+        return values.reshape(-1, len(Config.FEATURES))
+    
     @staticmethod
     def create_feature_vector(selected_features: Dict[str, int]) -> np.ndarray:
         """
@@ -205,8 +386,58 @@ class SymptomProcessor:
         Returns:
             numpy array of feature values
         """
-        feature_values = np.array([selected_features[f] for f in Config.FEATURES])
+        feature_values = np.fromiter(
+            (selected_features[f] for f in Config.FEATURES),
+            dtype=np.int8,
+            count=len(Config.FEATURES)
+        )
         return feature_values.reshape(1, -1)
+    
+    @staticmethod
+    def pack_feature_vector(feature_values: np.ndarray) -> int:
+        """
+        Pack a 0/1 feature vector into one integer code (bit i = feature i)
+        
+        Args:
+            feature_values: Raw feature vector from create_feature_vector
+            
+        Returns:
+            Integer code in [0, 2**n_features)
+        """
+        bits = np.packbits(np.asarray(feature_values, dtype=np.uint8).ravel(), bitorder='little')
+        return int.from_bytes(bits.tobytes(), 'little')
+    
+    @staticmethod
+    def unpack_feature_codes(codes) -> np.ndarray:
+        """
+        Expand packed symptom codes back to feature vectors with one shift-and-mask broadcast
+        
+        Args:
+            codes: Integer code or array of codes from pack_feature_vector
+            
+        Returns:
+            float32 array of shape (n_codes, n_features)
+        """
+        codes = np.asarray(codes, dtype=np.uint32).reshape(-1, 1)
+        return ((codes >> np.arange(len(Config.FEATURES), dtype=np.uint32)) & 1).astype(np.float32)
+    
+    @staticmethod
+    def scale_feature_vector(feature_values: np.ndarray, mean: np.ndarray, inv_scale: np.ndarray) -> np.ndarray:
+        """
+        Standardize a feature vector with fitted StandardScaler statistics
+        
+        Args:
+            feature_values: Raw feature vector from create_feature_vector
+            mean: Scaler mean as float32
+            inv_scale: Reciprocal of the scaler scale (1 / scale_) as float32
+            
+        Returns:
+            float32 array, scaled in place after a single copy
+        """
+        scaled = feature_values.astype(np.float32)
+        scaled -= mean
+        scaled *= inv_scale
+        return scaled
 
 
 class ValidationHelper: